@@ -7,24 +7,90 @@ Author: Student
 Date: 2025
 """
 import os
+import re
+import sys
+import csv
+import time
+import argparse
+import contextlib
+import pickle
+import hashlib
+import zipfile
+import functools
 import warnings
 import mysql.connector as mysql
+from mysql.connector import errorcode
 from datetime import datetime
 
+# Optional: client-side payment analytics on a local NumPy snapshot. numpy,
+# numba and the kernels are only loaded by load_snapshot_kernels(), so runs
+# without ANALYTICS_SNAPSHOT don't pay for the imports
+np = numba = None
+bucketize = group_reduce = None
+
 # Suppress getpass warnings
 warnings.filterwarnings("ignore", category=UserWarning, module="getpass")
 
+# On-disk query result cache (the dataset is static and read-only)
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "ecommerce_analytics")
+CACHE_TTL = 3600  # seconds
+FETCH_CHUNK_SIZE = 10_000  # rows per fetchmany() call
+
+# Connector/Python 9.2 removed execute(..., multi=True) in favour of
+# execute(..., map_results=True) plus nextset()
+MULTI_RESULTS_API = tuple(mysql.__version_info__[:2]) >= (9, 2)
+# v2 keeps NULL payment values (as NaN); older snapshots dropped those rows
+PAYMENTS_SNAPSHOT = os.path.join(CACHE_DIR, "payments_snapshot_v2.npz")
+
+# NULL placeholder for display; every other value is stringified by the
+# row format's !s conversion
+_NULL = 'NULL'
+_fmt = lambda v: _NULL if v is None else v
+
+# Indexes backing the GROUP BY columns of the analytical queries; the extra
+# columns let MySQL answer from the index alone
+QUERY_INDEXES = [
+    ("olist_order_payments_dataset", "idx_ptype", "payment_type, payment_installments, payment_value"),
+    ("olist_customers_dataset", "idx_state", "customer_state"),
+    ("olist_products_dataset", "idx_cat", "product_category_name"),
+    ("olist_sellers_dataset", "idx_seller_state", "seller_state, seller_id"),
+    ("olist_geolocation_dataset", "idx_geo", "geolocation_state, geolocation_zip_code_prefix")
+]
+
+# Table-wide denominators, filled into {name} placeholders in query text by render_sql()
+QUERY_TOTALS = {
+    'pay_sum': "SELECT SUM(value_sum) FROM _pay_summary;",
+    'customer_count': "SELECT COUNT(*) FROM olist_customers_dataset;",
+    'category_product_count': "SELECT COUNT(*) FROM olist_products_dataset WHERE product_category_name IS NOT NULL;"
+}
+
+def get_keyring_password(user):
+    """Look up the MySQL password in the OS keyring (service 'adilet_ds_mysql')"""
+    try:
+        import keyring
+        from keyring.errors import KeyringError
+    except ImportError:
+        return None
+    try:
+        return keyring.get_password('adilet_ds_mysql', user)
+    except KeyringError:
+        return None
+
 def get_database_connection():
     """Get database connection to adilet_ds"""
     config = {
         'host': '127.0.0.1',
         'port': 3306,
         'user': 'root',
-        'database': 'adilet_ds'
+        'database': 'adilet_ds',
+        'use_pure': False,  # C extension driver
+        'consume_results': True  # discard what a batch left unread when it stopped on an error
     }
     
-    # Get password
-    password = os.getenv('MYSQL_PASSWORD')
+    # Get password: OS keyring first, then environment, then prompt
+    password = get_keyring_password(config['user'])
+    if not password:
+        password = os.getenv('MYSQL_PASSWORD')
     if not password:
         import getpass
         password = getpass.getpass("MySQL password: ")
@@ -32,97 +98,591 @@ def get_database_connection():
     config['password'] = password
     
     try:
-        connection = mysql.connect(**config)
+        try:
+            connection = mysql.connect(**config)
+        except ImportError:
+            # C extension not installed: fall back to the pure Python driver
+            config['use_pure'] = True
+            connection = mysql.connect(**config)
         print(f"✅ Connected to database '{config['database']}'")
         return connection
     except mysql.Error as e:
         print(f"❌ Connection failed: {e}")
         return None
 
-def execute_query(connection, query_name, sql_query, limit_rows=None):
-    """Execute query and display results in a formatted way"""
-    print(f"\n{'='*80}")
-    print(f"📊 {query_name}")
-    print('='*80)
-    print(f"Query: {sql_query.strip()[:100]}{'...' if len(sql_query.strip()) > 100 else ''}")
-    print("-" * 80)
+@contextlib.contextmanager
+def database_session():
+    """Share one lazily opened database connection within a with-block
+    
+    Yields connect(), which opens the connection on its first call and returns
+    the same one afterwards, so a run answered entirely from the result cache
+    and the payments snapshot never connects. A failed connection attempt is
+    not retried. The connection is closed when the block exits.
+    """
+    state = {}
+    
+    def connect():
+        if "connection" not in state:
+            state["connection"] = get_database_connection()
+        if state["connection"] is None:
+            raise mysql.InterfaceError("no database connection")
+        return state["connection"]
     
     try:
-        cursor = connection.cursor()
-        cursor.execute(sql_query)
-        results = cursor.fetchall()
-        columns = [desc[0] for desc in cursor.description]
-        
-        if not results:
-            print("❌ No results found.")
+        yield connect
+    finally:
+        if state.get("connection") is not None:
+            state["connection"].close()
+
+def _cache_path(sql_query):
+    """Cache file for a query, keyed by the SHA-1 of its whitespace-normalized text"""
+    key = hashlib.sha1(" ".join(sql_query.split()).encode("utf-8")).hexdigest()
+    return os.path.join(CACHE_DIR, f"{key}.pkl")
+
+def _cache_load(sql_query, ttl):
+    """Return the cached (columns, rows) for a query, or None if missing or expired"""
+    path = _cache_path(sql_query)
+    try:
+        if time.time() - os.path.getmtime(path) > ttl:
+            return None
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    except (OSError, pickle.PickleError, EOFError):
+        return None
+
+def _cache_store(sql_query, result):
+    """Persist a query result; a read-only or full disk just disables caching"""
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(_cache_path(sql_query), "wb") as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+    except OSError:
+        pass
+
+def iter_rows(cursor, chunk_size=FETCH_CHUNK_SIZE):
+    """Yield a cursor's rows, fetching them from the server in chunks
+    
+    This bounds the number of driver calls, not memory: callers that cache or
+    display a result still collect every row into a list. Only a caller that
+    consumes rows as they arrive (snapshot_payments) avoids holding them.
+    """
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
             return
-        
-        # Limit results if specified
-        display_results = results[:limit_rows] if limit_rows else results
-        
-        # Calculate column widths for better formatting
-        col_widths = {}
-        for col in columns:
-            col_widths[col] = max(len(str(col)), 10)
-        
-        for row in display_results[:5]:  # Check first 5 rows for width calculation
-            for i, val in enumerate(row):
-                col = columns[i]
-                val_len = len(str(val)) if val is not None else 4
-                col_widths[col] = max(col_widths[col], min(val_len, 20))
-        
-        # Print headers
-        header = " | ".join(f"{col:>{col_widths[col]}}" for col in columns)
-        print(header)
-        print("-" * len(header))
-        
-        # Print rows
-        for row in display_results:
-            row_str = " | ".join(
-                f"{str(val) if val is not None else 'NULL':>{col_widths[columns[i]]}}"
-                for i, val in enumerate(row)
-            )
-            print(row_str)
-        
-        # Summary
-        if limit_rows and len(results) > limit_rows:
-            print(f"\n📋 Showing {len(display_results)} of {len(results)} rows")
-        else:
-            print(f"\n📋 Total rows: {len(results)}")
-        
+        yield from rows
+
+def fetch_results(connection, sql_query):
+    """Execute query and return (columns, rows)"""
+    cursor = connection.cursor(buffered=False)
+    cursor.execute(sql_query)
+    columns = [desc[0] for desc in cursor.description]
+    results = list(iter_rows(cursor))
+    cursor.close()
+    return columns, results
+
+def iter_result_sets(cursor, combined_sql):
+    """Execute a multi-statement string and yield (columns, rows) per statement"""
+    if MULTI_RESULTS_API:
+        cursor.execute(combined_sql, map_results=True)
+        while True:
+            yield [desc[0] for desc in cursor.description], list(iter_rows(cursor))
+            if not cursor.nextset():
+                return
+    else:
+        for result_cursor in cursor.execute(combined_sql, multi=True):
+            yield [desc[0] for desc in result_cursor.description], list(iter_rows(result_cursor))
+
+def fetch_batch(connect, sql_queries, ttl=CACHE_TTL, render=None):
+    """Execute several queries in one round trip and return (columns, rows) for each
+    
+    Cached queries are left out of the batch. If a statement fails, the ones
+    after it never run, so they are retried one by one; a query that still
+    fails is returned as its exception.
+    
+    connect() (see database_session()) is only called when a query misses the
+    cache. render(connection, sql_query), if given, turns a query into the
+    statement actually sent. It also only runs for cache misses, and results
+    are cached under the unrendered text.
+    """
+    results = [_cache_load(sql_query, ttl) for sql_query in sql_queries]
+    missing = [i for i, result in enumerate(results) if result is None]
+    if not missing:
+        return results
+    try:
+        connection = connect()
+    except mysql.Error as e:
+        for i in missing:
+            results[i] = e
+        return results
+    
+    statements = {}
+    for i in missing:
+        try:
+            statements[i] = sql_queries[i] if render is None else render(connection, sql_queries[i])
+        except mysql.Error as e:
+            results[i] = e
+    pending = list(statements)
+    if not pending:
+        return results
+    
+    combined_sql = "\n".join(f"{statements[i].strip().rstrip(';')};" for i in pending)
+    cursor = connection.cursor(buffered=False)
+    try:
+        for i, result in zip(pending, iter_result_sets(cursor, combined_sql)):
+            results[i] = result
+            _cache_store(sql_queries[i], result)
+    except (mysql.Error, TypeError) as e:
+        # A failed statement, or a driver without this multi-statement API
+        # (TypeError on the keyword); whatever is left runs one at a time below
+        print(f"⚠️  Batched execution stopped ({e}); running the remaining queries one at a time")
+    finally:
         cursor.close()
+    
+    for i in pending:
+        if results[i] is None:
+            try:
+                results[i] = fetch_results(connection, statements[i])
+                _cache_store(sql_queries[i], results[i])
+            except mysql.Error as e:
+                results[i] = e
+    return results
+
+def fetch_scalar(connection, sql_query):
+    """Execute a single-value query and return that value"""
+    cursor = connection.cursor(buffered=False)
+    cursor.execute(sql_query)
+    rows = cursor.fetchall()  # drain the result so the connection stays usable
+    cursor.close()
+    return rows[0][0] if rows else None
+
+def ensure_indexes(connection):
+    """Create the indexes in QUERY_INDEXES, skipping ones that already exist"""
+    cursor = connection.cursor(buffered=False)
+    for table, index_name, index_columns in QUERY_INDEXES:
+        try:
+            cursor.execute(f"ALTER TABLE {table} ADD INDEX {index_name} ({index_columns});")
+        except mysql.Error as e:
+            # MySQL has no ADD INDEX IF NOT EXISTS; a duplicate name means it is already there
+            if e.errno != errorcode.ER_DUP_KEYNAME:
+                print(f"⚠️  Could not create index {index_name} on {table}: {e}")
+    cursor.close()
+
+def create_payment_summary(connection):
+    """Pre-aggregate the payments table into the session-scoped _pay_summary table
+    
+    One scan of olist_order_payments_dataset yields ~100 rows (one per payment
+    type, installment count and value range) that the payment queries and the
+    payment total read instead of re-scanning the full table.
+    """
+    cursor = connection.cursor(buffered=False)
+    cursor.execute("DROP TEMPORARY TABLE IF EXISTS _pay_summary;")
+    cursor.execute("""
+        CREATE TEMPORARY TABLE _pay_summary AS
+        SELECT 
+            payment_type,
+            payment_installments,
+            CASE 
+                WHEN payment_value < 50 THEN 'Low (< R$50)'
+                WHEN payment_value < 200 THEN 'Medium (R$50-200)'
+                WHEN payment_value < 500 THEN 'High (R$200-500)'
+                ELSE 'Very High (> R$500)'
+            END as payment_range,
+            COUNT(*) as transaction_count,
+            COUNT(payment_value) as value_count,
+            SUM(payment_value) as value_sum
+        FROM olist_order_payments_dataset
+        GROUP BY payment_type, payment_installments, payment_range;
+    """)
+    cursor.close()
+
+def render_sql(connection, sql_query, prepared):
+    """Set up what a query needs on the server and fill in its {total} placeholders
+    
+    The indexes, the _pay_summary table and each QUERY_TOTALS value are
+    created or computed at most once per session, recorded in the prepared
+    dict, and only when a statement that needs them is about to be sent.
+    """
+    if "indexes" not in prepared:
+        ensure_indexes(connection)
+        prepared["indexes"] = True
+    if "_pay_summary" not in prepared and ("_pay_summary" in sql_query or "{pay_sum}" in sql_query):
+        create_payment_summary(connection)
+        prepared["_pay_summary"] = True
+    for name, total_sql in QUERY_TOTALS.items():
+        placeholder = "{" + name + "}"
+        if placeholder in sql_query:
+            if name not in prepared:
+                prepared[name] = fetch_scalar(connection, total_sql) or 0
+            sql_query = sql_query.replace(placeholder, str(prepared[name]))
+    return sql_query
+
+def load_snapshot_kernels():
+    """Import numpy and numba and compile the snapshot kernels on first use
+    
+    Returns False if numpy or numba is not installed.
+    """
+    global np, numba, bucketize, group_reduce
+    if numba is not None:
+        return True
+    try:
+        import numpy
+        import numba as numba_module
+    except ImportError:
+        return False
+    np, numba = numpy, numba_module
+    
+    # NaN marks a NULL payment_value: it counts as a row but adds no value,
+    # matching COUNT(*) vs COUNT(payment_value)/SUM(payment_value) in SQL
+    @numba.njit(parallel=True, cache=True)
+    def bucketize(values):
+        """Count rows, non-NULL values and their sum per payment range
         
-    except Exception as e:
-        print(f"❌ Query failed: {e}")
+        Ranges are < 50, < 200, < 500 and the rest; NULL falls into the
+        last one, like the ELSE branch of the SQL CASE.
+        """
+        c0 = c1 = c2 = c3 = 0
+        s0 = s1 = s2 = s3 = 0.0
+        nulls = 0
+        for i in numba.prange(values.shape[0]):
+            v = values[i]
+            null = np.isnan(v)
+            x = 0.0 if null else v
+            bucket = 3 if null else np.int64(x >= 50) + np.int64(x >= 200) + np.int64(x >= 500)
+            c0 += bucket == 0
+            c1 += bucket == 1
+            c2 += bucket == 2
+            c3 += bucket == 3
+            s0 += x * (bucket == 0)
+            s1 += x * (bucket == 1)
+            s2 += x * (bucket == 2)
+            s3 += x * (bucket == 3)
+            nulls += null
+        counts = np.array([c0, c1, c2, c3])
+        return counts, counts - np.array([0, 0, 0, nulls]), np.array([s0, s1, s2, s3])
+    
+    @numba.njit(cache=True)
+    def group_reduce(codes, values, n_groups):
+        """Count rows, non-NULL values and their sum per integer group code"""
+        counts = np.zeros(n_groups, dtype=np.int64)
+        value_counts = np.zeros(n_groups, dtype=np.int64)
+        sums = np.zeros(n_groups, dtype=np.float64)
+        for i in range(codes.shape[0]):
+            counts[codes[i]] += 1
+            if not np.isnan(values[i]):
+                value_counts[codes[i]] += 1
+                sums[codes[i]] += values[i]
+        return counts, value_counts, sums
+    
+    return True
+
+def snapshot_payments(connect, path=PAYMENTS_SNAPSHOT):
+    """Load the payments table as NumPy arrays, saving a local snapshot on first use
+    
+    The snapshot never expires; delete the file to refresh it. A missing or
+    unreadable file is rebuilt from the table, and a snapshot that cannot be
+    saved is still returned. connect() is only called to rebuild it.
+    """
+    try:
+        with np.load(path) as data:
+            return {key: data[key] for key in data.files}
+    except (OSError, ValueError, zipfile.BadZipFile):
+        pass
+    
+    cursor = connect().cursor(buffered=False)
+    cursor.execute("""
+        SELECT payment_value, payment_type, payment_installments
+        FROM olist_order_payments_dataset;
+    """)
+    # Split the chunked stream straight into columns rather than keeping row tuples
+    values, types, installments = [], [], []
+    for payment_value, payment_type, payment_installments in iter_rows(cursor):
+        values.append(np.nan if payment_value is None else payment_value)  # NaN marks NULL
+        types.append("NULL" if payment_type is None else payment_type)
+        installments.append(-1 if payment_installments is None else payment_installments)  # -1 marks NULL
+    cursor.close()
+    
+    type_names, type_codes = np.unique(np.array(types, dtype=str), return_inverse=True)
+    snapshot = {
+        "payment_value": np.array(values, dtype=np.float64),
+        "type_codes": type_codes.astype(np.int64),
+        "type_names": type_names,
+        "installments": np.array(installments, dtype=np.int64)
+    }
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.savez(path, **snapshot)
+    except OSError:
+        pass
+    return snapshot
+
+def _amount(value, raw_numbers):
+    """Round a computed amount to 2 places, as text like MySQL FORMAT() unless raw_numbers"""
+    if value is None:
+        return None
+    return round(float(value), 2) if raw_numbers else f"{value:,.2f}"
+
+def _value_stats(value_counts, sums, g):
+    """(average, total) of group g's non-NULL values; both None, like SQL, if it has none"""
+    if not value_counts[g]:
+        return None, None
+    return sums[g] / value_counts[g], sums[g]
+
+def local_payment_methods(snapshot, limit_rows, raw_numbers=False):
+    """Query 1 (Payment Method Performance) computed from the snapshot"""
+    counts, value_counts, sums = group_reduce(
+        snapshot["type_codes"], snapshot["payment_value"], len(snapshot["type_names"])
+    )
+    total = sums.sum()
+    # ORDER BY SUM(value_sum) DESC puts groups without any value (NULL) last
+    groups = sorted((g for g in range(len(counts)) if counts[g]), key=lambda g: (not value_counts[g], -sums[g]))
+    columns = ["payment_type", "total_transactions", "avg_transaction_value", "total_revenue", "revenue_percentage"]
+    rows = []
+    for g in groups[:limit_rows]:
+        average, revenue = _value_stats(value_counts, sums, g)
+        percentage = revenue * 100.0 / total if revenue is not None and total else None
+        rows.append((str(snapshot["type_names"][g]), int(counts[g]), _amount(average, raw_numbers),
+                     _amount(revenue, raw_numbers), _amount(percentage, raw_numbers)))
+    return columns, rows, len(groups)
+
+def local_installments(snapshot, limit_rows, raw_numbers=False):
+    """Query 4 (Payment Installment Analysis) computed from the snapshot"""
+    installments = snapshot["installments"]
+    mask = (installments >= 0) & (installments <= 24)
+    counts, value_counts, sums = group_reduce(installments[mask], snapshot["payment_value"][mask], 25)
+    groups = [g for g in range(25) if counts[g]]
+    columns = ["payment_installments", "transaction_count", "avg_value_per_installment_plan", "total_value"]
+    rows = [
+        (g, int(counts[g]), *(_amount(v, raw_numbers) for v in _value_stats(value_counts, sums, g)))
+        for g in groups[:limit_rows]
+    ]
+    return columns, rows, len(groups)
+
+def local_payment_ranges(snapshot, limit_rows, raw_numbers=False):
+    """Query 5 (Payment Value Distribution) computed from the snapshot"""
+    labels = ["Low (< R$50)", "Medium (R$50-200)", "High (R$200-500)", "Very High (> R$500)"]
+    counts, value_counts, sums = bucketize(snapshot["payment_value"])
+    # ORDER BY the average puts a range without any value (NULL) first
+    groups = sorted(
+        (g for g in range(4) if counts[g]),
+        key=lambda g: (bool(value_counts[g]), sums[g] / value_counts[g] if value_counts[g] else 0.0)
+    )
+    columns = ["payment_range", "transaction_count", "avg_value_in_range", "total_value_in_range"]
+    rows = [
+        (labels[g], int(counts[g]), *(_amount(v, raw_numbers) for v in _value_stats(value_counts, sums, g)))
+        for g in groups[:limit_rows]
+    ]
+    return columns, rows, len(groups)
+
+def limit_sql(sql_query, limit_rows):
+    """Append LIMIT so the server truncates the result instead of Python"""
+    if isinstance(limit_rows, int) and limit_rows > 0 and 'LIMIT' not in sql_query.upper():
+        return f"{sql_query.strip().rstrip(';')} LIMIT {limit_rows};"
+    return sql_query
+
+def count_sql(sql_query):
+    """Wrap a query so it returns its full row count"""
+    return f"SELECT COUNT(*) FROM ({sql_query.strip().rstrip(';')}) AS counted_rows;"
+
+def specialize(query, raw_numbers=False):
+    """Bake a query spec's limit (and opt-in row count) into its SQL text once
+    
+    The resulting statement text is identical on every run, which keeps the
+    result cache and the server's statement cache hitting. With raw_numbers,
+    FORMAT() becomes ROUND() so machine-readable output gets numbers rather
+    than display strings with thousands separators.
+    """
+    if raw_numbers:
+        query["sql"] = re.sub(r"\bFORMAT\(", "ROUND(", query["sql"])
+    if query.get("count_total") and query.get("limit"):
+        query["count_sql"] = count_sql(query["sql"])
+    query["sql"] = limit_sql(query["sql"].strip().rstrip(';') + ";", query.get("limit"))
+    return query
+
+def print_query_header(query_name, sql_query, source=None):
+    """Print the banner shown above each query's output
+    
+    source, if given, names where a result not computed by sql_query came from.
+    """
+    print(f"\n{'='*80}")
+    print(f"📊 {query_name}")
+    print('='*80)
+    if source:
+        print(f"Source: {source}")
+    else:
+        print(f"Query: {sql_query.strip()[:100]}{'...' if len(sql_query.strip()) > 100 else ''}")
+    print("-" * 80)
+
+def output_path(query_name, output_dir, extension):
+    """Path of a query's output file: <output_dir>/<query slug>.<extension>"""
+    slug = re.sub(r"[^a-z0-9]+", "_", query_name.lower()).strip("_")
+    return os.path.join(output_dir, f"{slug}.{extension}")
+
+def write_csv(query_name, columns, results, output_dir):
+    """Save a result set as <output_dir>/<query slug>.csv and return the path"""
+    path = output_path(query_name, output_dir, "csv")
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        writer.writerows(results)
+    return path
+
+def write_parquet(query_name, columns, results, output_dir):
+    """Save a result set as <output_dir>/<query slug>.parquet and return the path"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    
+    table = pa.table({col: [row[i] for row in results] for i, col in enumerate(columns)})
+    path = output_path(query_name, output_dir, "parquet")
+    pq.write_table(table, path)
+    return path
+
+def display_results(query_name, sql_query, columns, results, total_rows=None,
+                    output_format="table", output_dir=".", source=None):
+    """Display query results as an aligned table, or save them as a CSV or Parquet file"""
+    print_query_header(query_name, sql_query, source)
+    
+    # Machine-readable output skips the width calculation and padding entirely;
+    # an empty result still gets a file with its columns
+    if output_format in ("csv", "parquet"):
+        write = write_csv if output_format == "csv" else write_parquet
+        path = write(query_name, columns, results, output_dir)
+        print(f"💾 Saved {len(results)} rows to {path}")
+        return
+    
+    if not results:
+        print("❌ No results found.")
+        return
+    
+    # Transpose to column-major once so each column's width is a single
+    # C-level max() over all its values (str(None) has the same length as
+    # the 'NULL' placeholder)
+    value_columns = list(zip(*results))
+    col_widths = [
+        max(len(str(col)), 10, min(max(map(len, map(str, value_columns[i]))), 20))
+        for i, col in enumerate(columns)
+    ]
+    
+    # Build the row format once instead of formatting each cell separately
+    row_fmt = " | ".join("{!s:>" + str(width) + "}" for width in col_widths)
+    
+    # Print headers
+    header = row_fmt.format(*columns)
+    print(header)
+    print("-" * len(header))
+    
+    # Print rows with a single write instead of one print() per row
+    lines = [row_fmt.format(*map(_fmt, row)) for row in results]
+    sys.stdout.write("\n".join(lines) + "\n")
+    
+    # Summary
+    if total_rows is not None and total_rows > len(results):
+        print(f"\n📋 Showing {len(results)} of {total_rows} rows")
+    else:
+        print(f"\n📋 Total rows: {len(results)}")
+
+def display_error(query_name, sql_query, error):
+    """Display a failed query"""
+    print_query_header(query_name, sql_query)
+    print(f"❌ Query failed: {error}")
+
+def fetch_queries(connect, queries, snapshot=None, render=None, raw_numbers=False):
+    """Fetch a list of specialize()d query specs in a single round trip
+    
+    Returns one (columns, rows, total_rows) tuple per query, or the
+    exception raised by a query that failed. When a payments snapshot is
+    given, queries with a "local" function are computed from it instead and
+    their spec gets a "source" naming the snapshot; raw_numbers is passed to
+    those functions.
+    connect and render are passed on to fetch_batch().
+    """
+    statements = []
+    for query in queries:
+        if snapshot is not None and query.get("local"):
+            continue
+        statements.append(query["sql"])
+        if query.get("count_sql"):
+            statements.append(query["count_sql"])
+    
+    fetched = iter(fetch_batch(connect, statements, render=render))
+    outcomes = []
+    for query in queries:
+        if snapshot is not None and query.get("local"):
+            outcomes.append(query["local"](snapshot, query.get("limit"), raw_numbers))
+            query["source"] = "local payments snapshot (ANALYTICS_SNAPSHOT)"
+            continue
+        result = next(fetched)
+        total_rows = None
+        if query.get("count_sql"):
+            count_result = next(fetched)
+            if not isinstance(count_result, Exception) and count_result[1]:
+                total_rows = count_result[1][0][0]
+        outcomes.append(result if isinstance(result, Exception) else (*result, total_rows))
+    return outcomes
+
+def display_query(query, outcome, output_format="table", output_dir="."):
+    """Display the outcome of fetch_queries() for one query spec"""
+    if isinstance(outcome, Exception):
+        display_error(query["name"], query["sql"], outcome)
+    else:
+        display_results(query["name"], query["sql"], *outcome, output_format, output_dir,
+                        query.get("source"))
+
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="E-commerce analytics dashboard for adilet_ds")
+    parser.add_argument(
+        "--format", choices=["table", "csv", "parquet"], default=None,
+        help="output format (default: table on a terminal, csv otherwise)"
+    )
+    parser.add_argument(
+        "--output-dir", default=".",
+        help="directory for --format=csv/parquet files (default: current directory)"
+    )
+    args = parser.parse_args(argv)
+    if args.format is None:
+        args.format = "table" if sys.stdout.isatty() else "csv"
+    return args
 
 def main():
     """Main function - executes analytical queries"""
+    args = parse_args()
+    if args.format == "parquet":
+        try:
+            import pyarrow.parquet  # noqa: F401
+        except ImportError:
+            print("❌ --format=parquet requires pyarrow (pip install pyarrow)")
+            return
+    if args.format != "table":
+        os.makedirs(args.output_dir, exist_ok=True)
+    
     print("🚀 E-COMMERCE ANALYTICS DASHBOARD")
     print("=" * 60)
     print(f"📅 Analysis Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print("🗄️  Database: adilet_ds (Brazilian E-commerce Dataset)")
     print("=" * 60)
     
-    conn = get_database_connection()
-    if not conn:
-        return
-    
     # Define analytical queries to execute
+    # Display-only numbers come back pre-formatted via FORMAT() (ROUND() for
+    # csv/parquet, see specialize()); ORDER BY uses the numeric expression
+    # since the formatted aliases are strings.
+    # {name} placeholders are QUERY_TOTALS values, filled in by render_sql()
     analytical_queries = [
         {
             "name": "1. Payment Method Performance Analysis",
             "sql": """
             SELECT 
                 payment_type,
-                COUNT(*) as total_transactions,
-                ROUND(AVG(payment_value), 2) as avg_transaction_value,
-                ROUND(SUM(payment_value), 2) as total_revenue,
-                ROUND(SUM(payment_value) * 100.0 / (SELECT SUM(payment_value) FROM olist_order_payments_dataset), 2) as revenue_percentage
-            FROM olist_order_payments_dataset 
+                SUM(transaction_count) as total_transactions,
+                FORMAT(SUM(value_sum) / SUM(value_count), 2) as avg_transaction_value,
+                FORMAT(SUM(value_sum), 2) as total_revenue,
+                FORMAT(SUM(value_sum) * 100.0 / {pay_sum}, 2) as revenue_percentage
+            FROM _pay_summary 
             GROUP BY payment_type 
-            ORDER BY total_revenue DESC;
+            ORDER BY SUM(value_sum) DESC;
             """,
-            "limit": 10
+            "limit": 10,
+            "local": local_payment_methods
         },
         
         {
@@ -131,12 +691,13 @@ def main():
             SELECT 
                 customer_state,
                 COUNT(*) as customer_count,
-                ROUND(COUNT(*) * 100.0 / (SELECT COUNT(*) FROM olist_customers_dataset), 2) as percentage
+                FORMAT(COUNT(*) * 100.0 / {customer_count}, 2) as percentage
             FROM olist_customers_dataset 
             GROUP BY customer_state 
             ORDER BY customer_count DESC;
             """,
-            "limit": 15
+            "limit": 15,
+            "count_total": True
         },
         
         {
@@ -145,7 +706,7 @@ def main():
             SELECT 
                 product_category_name,
                 COUNT(*) as product_count,
-                ROUND(COUNT(*) * 100.0 / (SELECT COUNT(*) FROM olist_products_dataset WHERE product_category_name IS NOT NULL), 2) as category_percentage
+                FORMAT(COUNT(*) * 100.0 / {category_product_count}, 2) as category_percentage
             FROM olist_products_dataset 
             WHERE product_category_name IS NOT NULL
             GROUP BY product_category_name 
@@ -160,41 +721,33 @@ def main():
             "sql": """
             SELECT 
                 payment_installments,
-                COUNT(*) as transaction_count,
-                ROUND(AVG(payment_value), 2) as avg_value_per_installment_plan,
-                ROUND(SUM(payment_value), 2) as total_value
-            FROM olist_order_payments_dataset 
+                SUM(transaction_count) as transaction_count,
+                FORMAT(SUM(value_sum) / SUM(value_count), 2) as avg_value_per_installment_plan,
+                FORMAT(SUM(value_sum), 2) as total_value
+            FROM _pay_summary 
             WHERE payment_installments IS NOT NULL AND payment_installments <= 24
             GROUP BY payment_installments 
             ORDER BY payment_installments;
             """,
-            "limit": 15
+            "limit": 15,
+            "count_total": True,
+            "local": local_installments
         },
         
         {
             "name": "5. Payment Value Distribution Analysis",
             "sql": """
             SELECT 
-                CASE 
-                    WHEN payment_value < 50 THEN 'Low (< R$50)'
-                    WHEN payment_value < 200 THEN 'Medium (R$50-200)'
-                    WHEN payment_value < 500 THEN 'High (R$200-500)'
-                    ELSE 'Very High (> R$500)'
-                END as payment_range,
-                COUNT(*) as transaction_count,
-                ROUND(AVG(payment_value), 2) as avg_value_in_range,
-                ROUND(SUM(payment_value), 2) as total_value_in_range
-            FROM olist_order_payments_dataset 
-            GROUP BY 
-                CASE 
-                    WHEN payment_value < 50 THEN 'Low (< R$50)'
-                    WHEN payment_value < 200 THEN 'Medium (R$50-200)'
-                    WHEN payment_value < 500 THEN 'High (R$200-500)'
-                    ELSE 'Very High (> R$500)'
-                END
-            ORDER BY avg_value_in_range;
+                payment_range,
+                SUM(transaction_count) as transaction_count,
+                FORMAT(SUM(value_sum) / SUM(value_count), 2) as avg_value_in_range,
+                FORMAT(SUM(value_sum), 2) as total_value_in_range
+            FROM _pay_summary 
+            GROUP BY payment_range
+            ORDER BY SUM(value_sum) / SUM(value_count);
             """,
-            "limit": None
+            "limit": None,
+            "local": local_payment_ranges
         },
         
         {
@@ -233,14 +786,14 @@ def main():
             SELECT 
                 product_category_name,
                 COUNT(*) as product_count,
-                ROUND(AVG(product_name_length), 1) as avg_name_length,
-                ROUND(AVG(product_description_length), 1) as avg_description_length,
-                ROUND(AVG(product_photos_qty), 1) as avg_photos_qty
+                FORMAT(AVG(product_name_length), 1) as avg_name_length,
+                FORMAT(AVG(product_description_length), 1) as avg_description_length,
+                FORMAT(AVG(product_photos_qty), 1) as avg_photos_qty
             FROM olist_products_dataset 
             WHERE product_category_name IS NOT NULL
             GROUP BY product_category_name 
             HAVING COUNT(*) >= 10
-            ORDER BY avg_description_length DESC 
+            ORDER BY AVG(product_description_length) DESC 
             LIMIT 10;
             """,
             "limit": 10
@@ -261,10 +814,7 @@ def main():
         }
     ]
     
-    # Execute basic verification queries first
-    print("\n🔍 BASIC DATA VERIFICATION")
-    print("=" * 40)
-    
+    # Basic verification queries are displayed first
     basic_queries = [
         {
             "name": "Database Tables Overview",
@@ -287,21 +837,7 @@ def main():
         }
     ]
     
-    # Execute basic queries
-    for query in basic_queries:
-        execute_query(conn, query["name"], query["sql"], query.get("limit"))
-    
-    # Execute analytical queries
-    print(f"\n🎯 ANALYTICAL INSIGHTS")
-    print("=" * 40)
-    
-    for query in analytical_queries:
-        execute_query(conn, query["name"], query["sql"], query.get("limit"))
-    
     # Data quality checks
-    print(f"\n🔍 DATA QUALITY CHECKS")
-    print("=" * 40)
-    
     quality_checks = [
         {
             "name": "NULL Values Check",
@@ -309,8 +845,8 @@ def main():
             SELECT 
                 'customers' as table_name,
                 COUNT(*) as total_rows,
-                SUM(CASE WHEN customer_id IS NULL THEN 1 ELSE 0 END) as null_customer_ids,
-                SUM(CASE WHEN customer_state IS NULL THEN 1 ELSE 0 END) as null_states
+                COUNT(*) - COUNT(customer_id) as null_customer_ids,
+                COUNT(*) - COUNT(customer_state) as null_states
             FROM olist_customers_dataset
             
             UNION ALL
@@ -318,18 +854,55 @@ def main():
             SELECT 
                 'payments' as table_name,
                 COUNT(*) as total_rows,
-                SUM(CASE WHEN order_id IS NULL THEN 1 ELSE 0 END) as null_order_ids,
-                SUM(CASE WHEN payment_value IS NULL THEN 1 ELSE 0 END) as null_payment_values
+                COUNT(*) - COUNT(order_id) as null_order_ids,
+                COUNT(*) - COUNT(payment_value) as null_payment_values
             FROM olist_order_payments_dataset;
             """,
             "limit": None
         }
     ]
     
-    for check in quality_checks:
-        execute_query(conn, check["name"], check["sql"], check.get("limit"))
+    raw_numbers = args.format != "table"
+    for query in basic_queries + analytical_queries + quality_checks:
+        specialize(query, raw_numbers)
+    
+    # The connection is only opened once something has to come from the server,
+    # and closed before anything is displayed
+    with database_session() as connect:
+        # Optionally answer the payment analytics from a local snapshot
+        snapshot = None
+        if os.getenv('ANALYTICS_SNAPSHOT'):
+            if not load_snapshot_kernels():
+                print("⚠️  ANALYTICS_SNAPSHOT is set but numpy/numba are not installed; using SQL")
+            else:
+                try:
+                    snapshot = snapshot_payments(connect)
+                except (mysql.Error, OSError, ValueError) as e:
+                    print(f"⚠️  Payments snapshot failed ({e}); using SQL")
+        
+        # Fetch every query in one round trip, then display them section by section
+        # Indexes, the payment summary and totals are only set up for queries that miss the cache
+        render = functools.partial(render_sql, prepared={})
+        outcomes = iter(fetch_queries(connect, basic_queries + analytical_queries + quality_checks,
+                                      snapshot, render, raw_numbers))
     
-    conn.close()
+    print("\n🔍 BASIC DATA VERIFICATION")
+    print("=" * 40)
+    
+    for query in basic_queries:
+        display_query(query, next(outcomes), args.format, args.output_dir)
+    
+    print(f"\n🎯 ANALYTICAL INSIGHTS")
+    print("=" * 40)
+    
+    for query in analytical_queries:
+        display_query(query, next(outcomes), args.format, args.output_dir)
+    
+    print(f"\n🔍 DATA QUALITY CHECKS")
+    print("=" * 40)
+    
+    for check in quality_checks:
+        display_query(check, next(outcomes), args.format, args.output_dir)
     
     print(f"\n{'='*80}")
     print("✅ ANALYSIS COMPLETE!")
@@ -337,7 +910,11 @@ def main():
     print(f"   • Executed {len(basic_queries) + len(analytical_queries) + len(quality_checks)} queries")
     print("   • Analyzed payment methods, customer distribution, and product categories")
     print("   • Performed data quality checks")
-    print("   • Results displayed in formatted tables")
+    print({
+        "table": "   • Results displayed in formatted tables",
+        "csv": f"   • Results saved as CSV files in {args.output_dir}",
+        "parquet": f"   • Results saved as Parquet files in {args.output_dir}"
+    }[args.format])
     print("=" * 80)
 
 if __name__ == "__main__":
@@ -152,23 +152,22 @@ ORDER BY unique_zip_codes DESC;
 -- Topic 9: Payment Value Distribution Analysis
 -- Creates payment value ranges to understand spending patterns
 SELECT 
-    CASE 
-        WHEN payment_value < 50 THEN 'Low (< R$50)'
-        WHEN payment_value < 200 THEN 'Medium (R$50-200)'
-        WHEN payment_value < 500 THEN 'High (R$200-500)'
-        ELSE 'Very High (> R$500)'
-    END as payment_range,
+    payment_range,
     COUNT(*) as transaction_count,
     ROUND(AVG(payment_value), 2) as avg_value_in_range,
     ROUND(SUM(payment_value), 2) as total_value_in_range
-FROM olist_order_payments_dataset 
-GROUP BY 
-    CASE 
-        WHEN payment_value < 50 THEN 'Low (< R$50)'
-        WHEN payment_value < 200 THEN 'Medium (R$50-200)'
-        WHEN payment_value < 500 THEN 'High (R$200-500)'
-        ELSE 'Very High (> R$500)'
-    END
+FROM (
+    SELECT 
+        payment_value,
+        CASE 
+            WHEN payment_value < 50 THEN 'Low (< R$50)'
+            WHEN payment_value < 200 THEN 'Medium (R$50-200)'
+            WHEN payment_value < 500 THEN 'High (R$200-500)'
+            ELSE 'Very High (> R$500)'
+        END as payment_range
+    FROM olist_order_payments_dataset
+) AS ranged_payments
+GROUP BY payment_range
 ORDER BY avg_value_in_range;
 
 -- Topic 10: Product Content Analysis
@@ -225,8 +224,8 @@ ORDER BY c.customer_state, total_payments DESC;
 SELECT 
     'customers' as table_name,
     COUNT(*) as total_rows,
-    SUM(CASE WHEN customer_id IS NULL THEN 1 ELSE 0 END) as null_customer_ids,
-    SUM(CASE WHEN customer_state IS NULL THEN 1 ELSE 0 END) as null_states
+    COUNT(*) - COUNT(customer_id) as null_customer_ids,
+    COUNT(*) - COUNT(customer_state) as null_states
 FROM olist_customers_dataset
 
 UNION ALL
@@ -234,8 +233,8 @@ UNION ALL
 SELECT 
     'payments' as table_name,
     COUNT(*) as total_rows,
-    SUM(CASE WHEN order_id IS NULL THEN 1 ELSE 0 END) as null_order_ids,
-    SUM(CASE WHEN payment_value IS NULL THEN 1 ELSE 0 END) as null_payment_values
+    COUNT(*) - COUNT(order_id) as null_order_ids,
+    COUNT(*) - COUNT(payment_value) as null_payment_values
 FROM olist_order_payments_dataset;
 
 -- Check for duplicate records